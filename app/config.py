@@ -5,5 +5,34 @@ MODELS = [
 # Ollama HTTP endpoint
 OLLAMA_URL = "http://localhost:11434/api/chat"
 
+# Max in-flight Ollama requests; keep in sync with the server's
+# OLLAMA_NUM_PARALLEL so we saturate it without queueing blindly.
+OLLAMA_NUM_PARALLEL = 4
+
+# Keep models (and their cached prompt prefix) loaded between calls so
+# the shared SYSTEM + schema tokens aren't re-evaluated per chunk.
+OLLAMA_KEEP_ALIVE = "30m"
+
 # Some models honor this and will emit strict JSON
 JSON_FORMAT_OPTION = True
+
+# Per-attempt cap on one Ollama call, in seconds. Keep it just above the
+# typical chunk latency so a stalled generation doesn't block the job.
+REQUEST_TIMEOUT = 30
+
+# How many times to attempt a call before giving up (with backoff).
+MAX_RETRIES = 3
+
+# Cap on generated tokens; bounds worst-case generation time.
+NUM_PREDICT = 1024
+
+# Rasterization DPI for OCR. 200 is plenty for printed statements;
+# bump to 300 for dense small fonts.
+OCR_DPI = 200
+
+# Entries kept in the in-memory (model, prompt-hash) -> response cache.
+# Repeated uploads and duplicate pages skip the model call entirely.
+LLM_CACHE_SIZE = 256
+
+# Seconds a finished job's progress entry stays queryable before eviction.
+PROGRESS_TTL_SECONDS = 3600
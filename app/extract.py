@@ -1,27 +1,35 @@
 import io
-from typing import List, Optional
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
 
 import pdfplumber
 from pypdf import PdfReader
 from pdf2image import convert_from_bytes
 import pytesseract
 
-def _unlock_pdf(raw_bytes: bytes, password: Optional[str]) -> bytes:
-    """
-    If encrypted, verify the password. We return the same bytes since
-    pdfplumber can accept the password directly.
-    """
-    bio = io.BytesIO(raw_bytes)
-    reader = PdfReader(bio)
-    if reader.is_encrypted:
-        if not password:
-            raise ValueError("PDF is password-protected; no password provided.")
-        res = reader.decrypt(password)
-        if res in (0, False, None):
-            raise ValueError("Incorrect PDF password.")
-    return raw_bytes
+try:
+    import pypdfium2 as pdfium  # native PDF engine; much faster than pdfplumber
+except ImportError:
+    pdfium = None
+
+from .config import OCR_DPI
+
+def _extract_with_pdfium(raw_bytes: bytes, password: Optional[str]) -> List[str]:
+    pdf = pdfium.PdfDocument(raw_bytes, password=password)
+    try:
+        return [pdf[i].get_textpage().get_text_range().strip() for i in range(len(pdf))]
+    finally:
+        pdf.close()
 
 def extract_text_by_page(raw_bytes: bytes, password: Optional[str]) -> List[str]:
+    # Primary path: PDFium (native). Fall back to pdfplumber/pypdf on any
+    # failure so behavior matches the pure-Python extractors exactly.
+    if pdfium is not None:
+        try:
+            return _extract_with_pdfium(raw_bytes, password)
+        except Exception:
+            pass
     pages_text: List[str] = []
     try:
         with pdfplumber.open(io.BytesIO(raw_bytes), password=password) as pdf:
@@ -42,33 +50,45 @@ def extract_text_by_page(raw_bytes: bytes, password: Optional[str]) -> List[str]
             pages_text.append((page.extract_text() or "").strip())
     return pages_text
 
-def needs_ocr(pages_text: List[str]) -> bool:
-    if not pages_text:
-        return False
-    empty_ratio = sum(1 for t in pages_text if not t) / float(len(pages_text))
-    return empty_ratio > 0.6
+def _ocr_one(img) -> str:
+    """Module-level so it is picklable for the process pool."""
+    return (pytesseract.image_to_string(img) or "").strip()
 
-def extract_with_ocr(raw_bytes: bytes) -> List[str]:
-    images = convert_from_bytes(raw_bytes, dpi=300)
-    texts: List[str] = []
-    for img in images:
-        txt = pytesseract.image_to_string(img)
-        texts.append((txt or "").strip())
-    return texts
+def extract_with_ocr(raw_bytes: bytes, page_indices: List[int]) -> Dict[int, str]:
+    """
+    Rasterize and OCR only the given 0-based page indices, returning
+    {page_index: text}. Text pages never hit poppler or tesseract.
+    """
+    images = []
+    for i in page_indices:
+        # Grayscale at moderate DPI: pixel count scales with dpi^2 and
+        # Tesseract gains nothing from color on printed statements.
+        rendered = convert_from_bytes(
+            raw_bytes, dpi=OCR_DPI, grayscale=True, first_page=i + 1, last_page=i + 1
+        )
+        images.append(rendered[0] if rendered else None)
+    present = [(i, img) for i, img in zip(page_indices, images) if img is not None]
+    if not present:
+        return {}
+    if len(present) == 1:
+        return {present[0][0]: _ocr_one(present[0][1])}
+    # Tesseract is CPU-bound and embarrassingly parallel across pages.
+    workers = min(len(present), max(1, (os.cpu_count() or 1) // 4))
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        texts = list(ex.map(_ocr_one, [img for _, img in present]))
+    return {i: txt for (i, _), txt in zip(present, texts)}
 
 def get_pages_text(raw_bytes: bytes, password: Optional[str]) -> List[str]:
-    raw_bytes = _unlock_pdf(raw_bytes, password)
+    # Passwords are handled inside extract_text_by_page: each extractor
+    # takes the password directly and the pypdf fallback raises the
+    # user-facing ValueError, so no separate pre-decrypt pass is needed.
     pages_text = extract_text_by_page(raw_bytes, password)
 
-    # If most pages came back empty (likely scanned), OCR them
-    if needs_ocr(pages_text):
-        ocr_pages = extract_with_ocr(raw_bytes)
-        L = max(len(pages_text), len(ocr_pages))
-        merged: List[str] = []
-        for i in range(L):
-            t = pages_text[i] if i < len(pages_text) else ""
-            o = ocr_pages[i] if i < len(ocr_pages) else ""
-            merged.append(o if not t and o else t or o)
-        pages_text = merged
+    # OCR only the pages that came back empty (likely scanned)
+    missing = [i for i, t in enumerate(pages_text) if not t]
+    if missing:
+        for i, txt in extract_with_ocr(raw_bytes, missing).items():
+            if txt:
+                pages_text[i] = txt
 
     return pages_text
@@ -1,7 +1,41 @@
+import asyncio
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
 import httpx
-from typing import Dict, List
+import orjson
+
+from .config import (
+    OLLAMA_URL,
+    JSON_FORMAT_OPTION,
+    LLM_CACHE_SIZE,
+    OLLAMA_KEEP_ALIVE,
+    REQUEST_TIMEOUT,
+    MAX_RETRIES,
+    NUM_PREDICT,
+)
+
+# Shared client: keeps pooled connections alive across calls instead of
+# re-handshaking per chunk. Plain HTTP/1.1 - Ollama serves cleartext and
+# httpx does not upgrade to h2c, so HTTP/2 would never engage anyway.
+_CLIENT: Optional[httpx.AsyncClient] = None
+
+def get_client() -> httpx.AsyncClient:
+    global _CLIENT
+    if _CLIENT is None or _CLIENT.is_closed:
+        _CLIENT = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=64),
+            timeout=httpx.Timeout(connect=5, read=180, write=30, pool=5),
+        )
+    return _CLIENT
 
-from .config import OLLAMA_URL, JSON_FORMAT_OPTION
+async def close_client():
+    global _CLIENT
+    if _CLIENT is not None and not _CLIENT.is_closed:
+        await _CLIENT.aclose()
+    _CLIENT = None
 
 SYSTEM = "You are a strict JSON extractor for bank statements; return only VALID JSON matching the schema, focus on INCOMING FUNDS (type \"credit\"), first search the page/document text for a printed total labelled like 'Total Credit', 'TOTAL CREDIT AMT', or 'Total Credits' (case-insensitive) and use that value as the total credit without computing; if none is present, then compute the total credit by summing 'credit' transactions; never include prose, chain-of-thought, or code fences."
 
@@ -70,42 +104,186 @@ PAGES:
 """
 
 
+# Prompt-eval time scales with input tokens, so strip statement
+# boilerplate the extractor is told to ignore anyway. Transactions always
+# carry digits; printed grand-total lines are kept explicitly.
+_TX_LINE_RE = re.compile(r"\d")
+_HDR_KEEP_RE = re.compile(r"total\s+credits?", re.IGNORECASE)
+_DROP_RE = re.compile(
+    r"https?://|www\.|opening\s+balance|closing\s+balance"
+    r"|^\s*page\s+\d+(?:\s+of\s+\d+)?\s*$",
+    re.IGNORECASE,
+)
+
+def _filter_page_text(txt: str) -> str:
+    kept = [
+        line
+        for line in txt.splitlines()
+        if _HDR_KEEP_RE.search(line)
+        or (_TX_LINE_RE.search(line) and not _DROP_RE.search(line))
+    ]
+    return "\n".join(kept)
+
 def build_prompt(pages: Dict[int, str]) -> str:
-    pages_block = "\n\n".join([f"--- PAGE {i} ---\n{txt}" for i, txt in pages.items()])
+    pages_block = "\n\n".join(
+        [f"--- PAGE {i} ---\n{_filter_page_text(txt)}" for i, txt in pages.items()]
+    )
     return PROMPT_TEMPLATE.format(schema_hint=SCHEMA_HINT, pages_block=pages_block)
 
+def _build_options() -> Dict:
+    options = {"temperature": 0, "num_predict": NUM_PREDICT}
+    if JSON_FORMAT_OPTION:
+        options["format"] = "json"
+    return options
+
+class _DepthTracker:
+    """
+    Incrementally tracks JSON nesting depth across streamed pieces,
+    carrying string/escape state between them. top_level_closed() is True
+    only once a bracket opened at depth 0 has been closed again - nested
+    sub-structures (every transaction object) never trigger it.
+    """
+
+    def __init__(self):
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._closed = False
+
+    def feed(self, piece: str) -> None:
+        for ch in piece:
+            if self._esc:
+                self._esc = False
+                continue
+            if ch == "\\":
+                self._esc = True
+                continue
+            if ch == '"':
+                self._in_str = not self._in_str
+                continue
+            if self._in_str:
+                continue
+            if ch in "[{":
+                self._depth += 1
+            elif ch in "]}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._closed = True
+
+    def top_level_closed(self) -> bool:
+        return self._closed
+
+async def _consume_stream(client: httpx.AsyncClient, payload: Dict) -> str:
+    """
+    Read a streamed /api/chat response, accumulating content from either
+    {"message":{"content":...}} or {"response":...} lines. Stops (and
+    drops the connection) once a top-level JSON block has closed, so a
+    model that rambles after its answer costs nothing. With format=json
+    (the default) Ollama already forbids trailing prose, so this is a
+    safety net for the non-JSON-format configuration.
+    """
+    parts: List[str] = []
+    tracker = _DepthTracker()
+    async with client.stream("POST", OLLAMA_URL, json=payload) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if not line:
+                continue
+            try:
+                data = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue
+            if not isinstance(data, dict):
+                continue
+            msg = data.get("message")
+            piece = msg.get("content") if isinstance(msg, dict) else None
+            if not isinstance(piece, str):
+                piece = data.get("response")
+            if isinstance(piece, str) and piece:
+                parts.append(piece)
+                tracker.feed(piece)
+                if tracker.top_level_closed():
+                    break
+            if data.get("done"):
+                break
+    return "".join(parts)
+
+async def _chat(model: str, messages: List[Dict[str, str]]) -> str:
+    """
+    POST to Ollama /api/chat with a bounded per-attempt timeout and
+    exponential backoff on timeouts/transport errors. Returns the
+    accumulated plain text content.
+    """
+    client = get_client()
+    payload = {
+        "model": model,
+        "messages": messages,
+        "stream": True,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": _build_options(),
+    }
+    last_exc: Exception = RuntimeError("no attempt made")
+    for attempt in range(MAX_RETRIES):
+        try:
+            return await asyncio.wait_for(
+                _consume_stream(client, payload),
+                timeout=REQUEST_TIMEOUT,
+            )
+        except (asyncio.TimeoutError, httpx.TransportError) as e:
+            last_exc = e
+            await asyncio.sleep(2 ** attempt)
+    raise last_exc
+
+async def warm_models(models: List[str]) -> None:
+    """
+    Prime each model at startup: load it with keep_alive and prefill the
+    shared SYSTEM prefix so Ollama's prompt cache already holds those
+    tokens when the first real chunk arrives. Failures are swallowed;
+    this is purely a warm-up.
+    """
+    client = get_client()
+    for m in models:
+        try:
+            await asyncio.wait_for(
+                client.post(
+                    OLLAMA_URL,
+                    json={
+                        "model": m,
+                        "messages": [{"role": "system", "content": SYSTEM}],
+                        "stream": False,
+                        "keep_alive": OLLAMA_KEEP_ALIVE,
+                        "options": {"num_predict": 1},
+                    },
+                ),
+                timeout=REQUEST_TIMEOUT,
+            )
+        except Exception:
+            pass
+
+# LRU of completed extractions keyed by (model, prompt hash): reuploads
+# and duplicate/blank pages resolve without another model call.
+_RESPONSE_CACHE: "OrderedDict[Tuple[str, bytes], str]" = OrderedDict()
+
 async def chat_ollama_model(model: str, user_content: str) -> str:
     """
     Calls Ollama /api/chat and returns plain text content.
-    Works with both {"message":{"content":...}} and {"response":...} payloads.
     Always returns a string; raises only for network/HTTP errors.
     """
-    options = {"temperature": 0}
-    if JSON_FORMAT_OPTION:
-        options["format"] = "json"
-    async with httpx.AsyncClient(timeout=180) as client:
-        r = await client.post(
-            OLLAMA_URL,
-            json={
-                "model": model,
-                "messages": [
-                    {"role": "system", "content": SYSTEM},
-                    {"role": "user", "content": user_content},
-                ],
-                "stream": False,
-                "options": options,
-            },
-        )
-        r.raise_for_status()
-        data = r.json() or {}
-        if isinstance(data, dict):
-            if "message" in data and isinstance(data["message"], dict):
-                content = data["message"].get("content")
-                if isinstance(content, str):
-                    return content
-            if "response" in data and isinstance(data["response"], str):
-                return data["response"]
-        return json.dumps(data)
+    key = (model, hashlib.sha256(user_content.encode()).digest())
+    if key in _RESPONSE_CACHE:
+        _RESPONSE_CACHE.move_to_end(key)
+        return _RESPONSE_CACHE[key]
+    result = await _chat(
+        model,
+        [
+            {"role": "system", "content": SYSTEM},
+            {"role": "user", "content": user_content},
+        ],
+    )
+    _RESPONSE_CACHE[key] = result
+    while len(_RESPONSE_CACHE) > LLM_CACHE_SIZE:
+        _RESPONSE_CACHE.popitem(last=False)
+    return result
 
 REPAIR_INSTRUCTION = (
     "Your previous response was not valid JSON. "
@@ -114,52 +292,12 @@ REPAIR_INSTRUCTION = (
 )
 
 async def chat_ollama_model_retry_json(model: str, original_user_content: str, previous_output: str) -> str:
-    options = {"temperature": 0}
-    if JSON_FORMAT_OPTION:
-        options["format"] = "json"
-    async with httpx.AsyncClient(timeout=180) as client:
-        r = await client.post(
-            OLLAMA_URL,
-            json={
-                "model": model,
-                "messages": [
-                    {"role": "system", "content": SYSTEM},
-                    {"role": "user", "content": original_user_content},
-                    {"role": "assistant", "content": previous_output},
-                    {"role": "user", "content": REPAIR_INSTRUCTION},
-                ],
-                "stream": False,
-                "options": options,
-            },
-        )
-        r.raise_for_status()
-        data = r.json() or {}
-        if isinstance(data, dict):
-            if "message" in data and isinstance(data["message"], dict):
-                content = data["message"].get("content")
-                if isinstance(content, str):
-                    return content
-            if "response" in data and isinstance(data["response"], str):
-                return data["response"]
-        return json.dumps(data)
-
-async def extract_page_chunk_multi(models: List[str], pages: Dict[int, str]) -> Dict[str, str]:
-    """
-    Runs all models concurrently on the same chunk.
-    Always returns a dict {model: raw_text_or_error_json}.
-    """
-    import asyncio
-    prompt = build_prompt(pages)
-    out: Dict[str, str] = {}
-    try:
-        tasks = [chat_ollama_model(m, prompt) for m in models]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        for m, res in zip(models, results):
-            if isinstance(res, Exception):
-                out[m] = f'{{"error":"{type(res).__name__}: {str(res)}"}}'
-            else:
-                out[m] = res if isinstance(res, str) else json.dumps(res)
-    except Exception as e:
-        for m in models:
-            out[m] = f'{{"error":"{type(e).__name__}: {str(e)}"}}'
-    return out
\ No newline at end of file
+    return await _chat(
+        model,
+        [
+            {"role": "system", "content": SYSTEM},
+            {"role": "user", "content": original_user_content},
+            {"role": "assistant", "content": previous_output},
+            {"role": "user", "content": REPAIR_INSTRUCTION},
+        ],
+    )
\ No newline at end of file
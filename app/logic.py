@@ -1,8 +1,10 @@
 import json
+import math
 import re
 from collections import Counter
 from typing import Dict, List, Tuple
 
+import orjson
 from pydantic import ValidationError
 
 from .schema import Transaction, PageExtraction, FinalReport
@@ -11,35 +13,73 @@ from .schema import Transaction, PageExtraction, FinalReport
 
 FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.MULTILINE)
 THINK_TAG_RE = re.compile(r"</?think[^>]*>", re.IGNORECASE)
+QUOTE_RE = re.compile(r"(?<!\\)'")
+
+# Structural characters only: escape pairs, quotes, brackets, braces.
+# Letting the regex engine skip everything else keeps the scan loop in C
+# instead of visiting every character from Python.
+_STRUCT_RE = re.compile(r'\\.|[\[\]{}"]', re.DOTALL)
+
+def _scan_balanced(text: str, start: int, opener: str, closer: str) -> int:
+    """
+    Scan from `start` (which must sit on `opener`) and return the index of
+    the closing character of the balanced region, or -1 if unbalanced.
+    """
+    depth = 0
+    in_str = False
+    for m in _STRUCT_RE.finditer(text, start):
+        ch = m.group()
+        if ch[0] == "\\":
+            continue
+        if ch == '"':
+            in_str = not in_str
+            continue
+        if in_str:
+            continue
+        if ch == opener:
+            depth += 1
+        elif ch == closer:
+            depth -= 1
+            if depth == 0:
+                return m.start()
+    return -1
+
+_OPENER_OF = {"]": "[", "}": "{"}
 
 def _find_balanced_json(text: str) -> str | None:
     """
-    Return the first balanced top-level JSON array or object found in text.
+    Return the first balanced top-level JSON array or object found in
+    text. Single left-to-right pass: a stack of unmatched opener
+    positions tracks both bracket kinds at once, so stray openers never
+    trigger a rescan from the start.
     """
-    for opener, closer in ("[]", "{}"):
-        start = text.find(opener[0])
-        while start != -1:
-            depth = 0
-            in_str = False
-            esc = False
-            for i in range(start, len(text)):
-                ch = text[i]
-                if ch == '"' and not esc:
-                    in_str = not in_str
-                if ch == "\\" and not esc:
-                    esc = True
-                    continue
-                esc = False
-                if in_str:
-                    continue
-                if ch == opener[0]:
-                    depth += 1
-                elif ch == closer[0]:
-                    depth -= 1
-                    if depth == 0:
-                        return text[start : i + 1]
-            start = text.find(opener[0], start + 1)
-    return None
+    stack: List[int] = []
+    in_str = False
+    first_nested: str | None = None
+    for m in _STRUCT_RE.finditer(text):
+        ch = m.group()
+        if ch[0] == "\\":
+            continue
+        if ch == '"':
+            in_str = not in_str
+            continue
+        if in_str:
+            continue
+        if ch in "[{":
+            stack.append(m.start())
+        elif stack:
+            if text[stack[-1]] != _OPENER_OF[ch]:
+                # Mismatched close: whatever was open isn't JSON
+                stack.clear()
+                continue
+            start = stack.pop()
+            if not stack:
+                return text[start : m.start() + 1]
+            if first_nested is None:
+                first_nested = text[start : m.start() + 1]
+    # No top-level block ever closed (e.g. a stray unclosed opener):
+    # fall back to the first balanced region seen inside it.
+    return first_nested
 
 def _wrap_multiple_top_objects(text: str) -> str | None:
     """
@@ -52,31 +92,11 @@ def _wrap_multiple_top_objects(text: str) -> str | None:
         j = s.find("{", i)
         if j == -1:
             break
-        depth = 0
-        in_str = False
-        esc = False
-        found = False
-        for k in range(j, len(s)):
-            ch = s[k]
-            if ch == '"' and not esc:
-                in_str = not in_str
-            if ch == "\\" and not esc:
-                esc = True
-                continue
-            esc = False
-            if in_str:
-                continue
-            if ch == "{":
-                depth += 1
-            elif ch == "}":
-                depth -= 1
-                if depth == 0:
-                    objs.append(s[j : k + 1])
-                    i = k + 1
-                    found = True
-                    break
-        if not found:
+        k = _scan_balanced(s, j, "{", "}")
+        if k == -1:
             break
+        objs.append(s[j : k + 1])
+        i = k + 1
     if len(objs) >= 2:
         return "[" + ",".join(objs) + "]"
     return None
@@ -85,13 +105,18 @@ def sanitize_model_json(text: str) -> str:
     # Coerce None to empty string
     if text is None:
         text = ""
-    # Strip code fences and <think> traces
-    text = FENCE_RE.sub("", str(text).strip())
-    text = THINK_TAG_RE.sub("", text)
+    # Strip code fences and <think> traces; most outputs have neither,
+    # so cheap containment checks skip the regex work entirely.
+    text = str(text).strip()
+    if "```" in text:
+        text = FENCE_RE.sub("", text)
+    low = text.lower()
+    if "<think" in low or "</think" in low:
+        text = THINK_TAG_RE.sub("", text)
 
     # Already valid?
     try:
-        json.loads(text)
+        orjson.loads(text)
         return text
     except Exception:
         pass
@@ -107,12 +132,12 @@ def sanitize_model_json(text: str) -> str:
         return wrapped
 
     # Last resort: convert bare single quotes to double quotes
-    soft = re.sub(r"(?<!\\)'", '"', text)
+    soft = QUOTE_RE.sub('"', text)
     cand = _find_balanced_json(soft)
     if cand:
         return cand
 
-    # Give up; let json.loads raise for diagnostics
+    # Give up; let orjson.loads raise for diagnostics
     return text
 
 # -------- Core pipeline logic --------
@@ -126,7 +151,7 @@ def chunk_pages(pages_text: List[str], chunk_size: int = 2) -> List[Dict[int, st
 
 def parse_llm_json(raw: str) -> List[PageExtraction]:
     raw = sanitize_model_json(raw)
-    data = json.loads(raw)
+    data = orjson.loads(raw)
 
     # Accept dict (single page) or list (multiple pages) or {"pages":[...]}
     if isinstance(data, dict) and "pages" in data and isinstance(data["pages"], list):
@@ -143,11 +168,10 @@ def parse_llm_json(raw: str) -> List[PageExtraction]:
     return pages
 
 def aggregate(pages: List[PageExtraction]) -> FinalReport:
-    txs: List[Transaction] = []
-    for p in pages:
-        for t in p.transactions:
-            txs.append(Transaction(**(t if isinstance(t, dict) else t.dict())))
-    total_credits = sum(t.amount for t in txs if t.type == "credit")
+    # Transactions were already validated by PageExtraction; no need to
+    # re-instantiate (and re-validate) every row here.
+    txs: List[Transaction] = [t for p in pages for t in p.transactions]
+    total_credits = math.fsum(t.amount for t in txs if t.type == "credit")
     currency_guess = next((t.currency for t in txs if t.currency), None)
     return FinalReport(
         total_credits=round(total_credits, 2),
@@ -169,6 +193,17 @@ def compare_models(reports: Dict[str, FinalReport]) -> Dict:
     values = list(totals.values())
     if not values:
         return {"agreement": False, "reason": "no valid reports"}
+    if len(values) == 1:
+        # Single model (the default config): nothing to vote on
+        total = round(values[0], 2)
+        return {
+            "agreement": True,
+            "range": {"min": values[0], "max": values[0], "spread": 0.0},
+            "majority_total_credits": total,
+            # String keys to match the multi-model path (orjson requirement)
+            "votes": {str(total): 1},
+            "per_model_totals": totals,
+        }
     lo, hi = min(values), max(values)
     agreement = (hi - lo) <= 1.0  # within 1 unit -> "agree"
     freq = Counter(round(v, 2) for v in values)
@@ -177,6 +212,7 @@ def compare_models(reports: Dict[str, FinalReport]) -> Dict:
         "agreement": agreement,
         "range": {"min": lo, "max": hi, "spread": round(hi - lo, 2)},
         "majority_total_credits": winner,
-        "votes": dict(freq),
+        # String keys: orjson refuses non-str dict keys
+        "votes": {str(k): v for k, v in freq.items()},
         "per_model_totals": totals,
     }
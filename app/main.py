@@ -3,17 +3,22 @@ import logging
 import sys
 import time
 import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List, Optional
 
 from fastapi import FastAPI, File, Form, HTTPException, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 
-from .config import MODELS
+from .config import MODELS, OLLAMA_NUM_PARALLEL, PROGRESS_TTL_SECONDS
 from .extract import get_pages_text
 from .llm import (
-    extract_page_chunk_multi,
+    chat_ollama_model,
     chat_ollama_model_retry_json,
     build_prompt,
+    close_client,
+    get_client,
+    warm_models,
 )
 from .logic import (
     aggregate,
@@ -35,8 +40,34 @@ app = FastAPI(
     title="PDF Statement Analyzer (Ollama Multi-Model)",
     description="Upload a PDF (with optional password) and compare qwen3:30b, gemma3:27b, and mistral:7b-instruct on transaction extraction.",
     version="1.3.0",
+    default_response_class=ORJSONResponse,
 )
 
+# Pool for CPU-bound JSON repair/validation of model outputs
+_PARSE_POOL: Optional[ProcessPoolExecutor] = None
+
+def _get_parse_pool() -> ProcessPoolExecutor:
+    global _PARSE_POOL
+    if _PARSE_POOL is None:
+        _PARSE_POOL = ProcessPoolExecutor()
+    return _PARSE_POOL
+
+@app.on_event("startup")
+async def _startup():
+    # One pooled HTTP client for all Ollama calls
+    app.state.http = get_client()
+    _get_parse_pool()
+    # Load default models and prefill the shared system-prompt prefix
+    await warm_models(MODELS)
+
+@app.on_event("shutdown")
+async def _shutdown():
+    global _PARSE_POOL
+    await close_client()
+    if _PARSE_POOL is not None:
+        _PARSE_POOL.shutdown(wait=False)
+        _PARSE_POOL = None
+
 # Simple in-memory progress store
 PROGRESS: Dict[str, Dict] = {}
 
@@ -47,7 +78,7 @@ def _init_progress(job_id: str, total_chunks: int, models: List[str]):
         "models": models,
         "last_step": "started",
         "per_model_ms": {m: 0.0 for m in models},
-        "history": [],
+        "history": deque(maxlen=32),
         "error": None,
         "started_at": time.time(),
     }
@@ -63,10 +94,28 @@ def _bump_progress(job_id: str, step: str = "", per_model_durations: Dict[str, f
         for m, ms in per_model_durations.items():
             p["per_model_ms"][m] = p["per_model_ms"].get(m, 0.0) + float(ms)
 
+def _schedule_eviction(job_id: str):
+    # Evict after a grace period so job entries don't leak forever
+    try:
+        asyncio.get_running_loop().call_later(
+            PROGRESS_TTL_SECONDS, PROGRESS.pop, job_id, None
+        )
+    except RuntimeError:
+        pass
+
 def _finish_progress(job_id: str):
     p = PROGRESS.get(job_id)
     if p:
         p["finished_at"] = time.time()
+        _schedule_eviction(job_id)
+
+def _fail_progress(job_id: str, error: str):
+    p = PROGRESS.get(job_id)
+    if p:
+        p["error"] = error
+        p["last_step"] = "failed"
+        p["finished_at"] = time.time()
+        _schedule_eviction(job_id)
 
 def _log_console_progress(job_id: str):
     p = PROGRESS.get(job_id)
@@ -84,7 +133,8 @@ def _log_console_progress(job_id: str):
 def get_progress(job_id: str):
     if job_id not in PROGRESS:
         raise HTTPException(status_code=404, detail="Unknown job_id")
-    return PROGRESS[job_id]
+    p = PROGRESS[job_id]
+    return {**p, "history": list(p["history"])}
 
 @app.post("/analyze-multi", response_model=MultiModelReport, summary="Analyze a PDF with multiple models")
 async def analyze_pdf_multi(
@@ -93,9 +143,12 @@ async def analyze_pdf_multi(
     pages_per_chunk: int = Form(default=2, ge=1, le=5, description="Pages to send to the model at once"),
     models: Optional[str] = Form(default=None, description="Comma-separated model list. Leave empty to use defaults."),
 ):
+    job_id = ""
     try:
         raw_bytes = await file.read()
-        pages_text = get_pages_text(raw_bytes, password)
+        # PDF parsing/OCR is CPU-bound; keep it off the event loop so
+        # other requests (and their model calls) can progress meanwhile
+        pages_text = await asyncio.to_thread(get_pages_text, raw_bytes, password)
         if not any(pages_text):
             raise HTTPException(status_code=422, detail="No readable text. If scanned, install OCR deps (poppler, tesseract).")
 
@@ -108,60 +161,86 @@ async def analyze_pdf_multi(
         _log_console_progress(job_id)
 
         # Raw outputs per model (list aligned by chunk order)
-        per_model_raw: Dict[str, List[str]] = {m: [] for m in use_models}
-
-        # Process chunk-by-chunk, all models concurrently per chunk
-        for idx, chunk in enumerate(chunks, start=1):
-            t0 = time.time()
-            _bump_progress(job_id, step=f"Chunk {idx}/{len(chunks)}: sending to models")
-            raw_by_model = await extract_page_chunk_multi(use_models, chunk)
-            if not isinstance(raw_by_model, dict):
-                _bump_progress(job_id, step=f"Chunk {idx}: unexpected engine result; coercing to empty dict")
-                raw_by_model = {}
-            t1 = time.time()
-
-            # Attempt immediate validation; if it fails, do a one-time repair retry
+        per_model_raw: Dict[str, List[str]] = {m: [""] * len(chunks) for m in use_models}
+
+        # Fan out every (chunk, model) pair at once, bounded by the server's
+        # parallelism, so network/model latency overlaps across the whole job
+        # instead of waiting on the slowest model chunk-by-chunk.
+        sem = asyncio.Semaphore(OLLAMA_NUM_PARALLEL)
+
+        # One prompt per chunk, shared by every model and the repair path
+        prompts = [build_prompt(chunk) for chunk in chunks]
+
+        async def _bounded_call(idx: int, model: str, prompt: str):
+            async with sem:
+                t0 = time.time()
+                try:
+                    raw = await chat_ollama_model(model, prompt)
+                except Exception as e:
+                    raw = f'{{"error":"{type(e).__name__}: {str(e)}"}}'
+                return idx, model, raw, (time.time() - t0) * 1000.0
+
+        _bump_progress(job_id, step=f"Sending {len(chunks)} chunk(s) x {len(use_models)} model(s)")
+        tasks = [
+            asyncio.create_task(_bounded_call(i, m, prompt))
+            for i, prompt in enumerate(prompts)
+            for m in use_models
+        ]
+        models_pending = {i: len(use_models) for i in range(len(chunks))}
+        for fut in asyncio.as_completed(tasks):
+            idx, m, raw, elapsed_ms = await fut
+            per_model_raw[m][idx] = raw
+            _bump_progress(job_id, per_model_durations={m: elapsed_ms})
+            models_pending[idx] -= 1
+            if models_pending[idx] == 0:
+                PROGRESS[job_id]["chunks_done"] += 1
+                _bump_progress(job_id, step=f"Chunk {idx + 1} complete")
+                _log_console_progress(job_id)
+
+        # JSON repair + Pydantic validation are CPU-bound Python; every
+        # parse (initial validation and repaired outputs alike) goes
+        # through the process pool, and each output is parsed exactly once
+        loop = asyncio.get_running_loop()
+        pool = _get_parse_pool()
+
+        def _pool_parse(raw: str):
+            return loop.run_in_executor(pool, parse_llm_json, raw)
+
+        _bump_progress(job_id, step="Parsing model outputs")
+        keys = [(m, i) for i in range(len(chunks)) for m in use_models]
+        first_pass = await asyncio.gather(
+            *[_pool_parse(per_model_raw[m][i]) for m, i in keys],
+            return_exceptions=True,
+        )
+        # parsed[m][i] is List[PageExtraction] on success, Exception on failure
+        parsed: Dict[str, List] = {m: [None] * len(chunks) for m in use_models}
+        for (m, i), res in zip(keys, first_pass):
+            parsed[m][i] = res
+
+        # One-time repair retry for outputs that failed validation
+        for idx, prompt in enumerate(prompts, start=1):
             for m in use_models:
-                raw = raw_by_model.get(m, "")
-                valid = True
+                if not isinstance(parsed[m][idx - 1], Exception):
+                    continue
                 try:
-                    _ = parse_llm_json(raw)
-                except Exception:
-                    valid = False
-
-                if not valid:
-                    try:
-                        repaired = await chat_ollama_model_retry_json(m, build_prompt(chunk), raw)
-                        _ = parse_llm_json(repaired)  # validate repaired
-                        raw = repaired
-                        _bump_progress(job_id, step=f"Chunk {idx}: {m} repaired JSON")
-                    except Exception as e:
-                        _bump_progress(job_id, step=f"Chunk {idx}: {m} repair failed: {type(e).__name__}")
-
-                per_model_raw[m].append(raw)
-
-            # Attribute chunk time across models (heuristic)
-            elapsed_ms = (t1 - t0) * 1000.0
-            per_model = elapsed_ms / max(1, len(use_models))
-            _bump_progress(job_id, per_model_durations={m: per_model for m in use_models})
-
-            PROGRESS[job_id]["chunks_done"] += 1
-            _bump_progress(job_id, step=f"Chunk {idx} complete")
-            _log_console_progress(job_id)
-
-        # Parse & aggregate per model (final pass)
+                    repaired = await chat_ollama_model_retry_json(m, prompt, per_model_raw[m][idx - 1])
+                    parsed[m][idx - 1] = await _pool_parse(repaired)
+                    per_model_raw[m][idx - 1] = repaired
+                    _bump_progress(job_id, step=f"Chunk {idx}: {m} repaired JSON")
+                except Exception as e:
+                    _bump_progress(job_id, step=f"Chunk {idx}: {m} repair failed: {type(e).__name__}")
+
+        # Aggregate per model from the recorded parse results
         by_model_report: Dict[str, FinalReport] = {}
         errors: Dict[str, str] = {}
-        _bump_progress(job_id, step="Parsing model outputs")
-
         for m in use_models:
             try:
                 page_list: List[PageExtraction] = []
-                for raw in per_model_raw[m]:
-                    try:
-                        page_list.extend(parse_llm_json(raw))
-                    except Exception as e:
-                        errors[m] = (errors.get(m, "") + f" {type(e).__name__}: {e}").strip()
+                for res in parsed[m]:
+                    if isinstance(res, Exception):
+                        errors[m] = (errors.get(m, "") + f" {type(res).__name__}: {res}").strip()
+                    else:
+                        page_list.extend(res)
                 if not page_list:
                     raise ValueError("No parsable JSON from model.")
                 by_model_report[m] = aggregate(page_list)
@@ -184,17 +263,19 @@ async def analyze_pdf_multi(
                 "per_model_ms": PROGRESS[job_id]["per_model_ms"],
                 "started_at": PROGRESS[job_id]["started_at"],
                 "finished_at": PROGRESS[job_id].get("finished_at"),
-                "history": PROGRESS[job_id]["history"][-12:],  # last few steps
+                "history": list(PROGRESS[job_id]["history"])[-12:],  # last few steps
             },
         )
 
-        resp = JSONResponse(payload.dict())
+        resp = ORJSONResponse(payload.dict())
         resp.headers["X-Job-Id"] = job_id
         return resp
 
     except ValueError as e:
         logger.exception("ValueError in /analyze-multi")
+        _fail_progress(job_id, str(e))
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception("Unhandled error in /analyze-multi")
+        _fail_progress(job_id, f"{type(e).__name__}: {e}")
         raise HTTPException(status_code=500, detail=f"Processing error: {e}")